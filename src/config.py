@@ -14,6 +14,11 @@ class Config:
     MEILISEARCH_URL = os.getenv("MEILISEARCH_URL", "http://localhost:7700")
     MEILISEARCH_MASTER_KEY = os.getenv("MEILISEARCH_MASTER_KEY", "")
     
+    # HTTP Connection Pool Configuration
+    HTTP_POOL_SIZE = 32
+    HTTP_TIMEOUT = 30.0  # Seconds
+    CONNECTION_CHECK_TTL = 60  # Seconds
+    
     # Application Configuration
     DEBUG = os.getenv("DEBUG", "True").lower() == "true"
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
@@ -22,6 +27,9 @@ class Config:
     INDEX_NAME = "ecommerce_orders"
     MAX_SEARCH_RESULTS = 5  # Reduced for faster processing
     LLM_MODEL = "anthropic/claude-3-haiku"  # Faster model
+    MAX_KEY_TERMS = 3  # Extra per-term searches added to each multi-search
+    SEARCH_CACHE_SIZE = 256
+    SEARCH_CACHE_TTL = 300  # Seconds
     
     # Data Configuration
     DATA_FILE = "data/Order Details.csv"
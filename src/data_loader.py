@@ -1,162 +1,234 @@
-import pandas as pd
-import json
-from typing import List, Dict, Any
+import os
+import sys
+import numpy as np
+import pyarrow as pa
+from pyarrow import csv as pacsv
+from pyarrow import feather
+import orjson
+from typing import Tuple, TYPE_CHECKING
 import logging
 
 from config import Config
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 logger = logging.getLogger(__name__)
 
+# Bump whenever the document layout or content produced by process_data changes,
+# so existing Feather caches are rebuilt instead of served stale
+_DOCUMENTS_FORMAT_VERSION = b"1"
+
+# Upper bucket edges and their labels, looked up per column with np.searchsorted.
+# Amount and profit edges are exclusive (amount < 100 is "low"); quantity edges
+# are inclusive (quantity <= 2 is "small").
+_AMOUNT_BINS = np.array([100.0, 500.0])
+_AMOUNT_LABELS = np.array(["low", "medium", "high"], dtype=object)
+_PRICE_DESCRIPTIONS = np.array(["affordable", "mid-range", "premium"], dtype=object)
+_QUALITY_DESCRIPTIONS = np.array(["good value", "high quality", "luxury"], dtype=object)
+
+_PROFIT_BINS = np.array([0.0, 50.0])
+_PROFIT_LABELS = np.array(["loss", "low_profit", "high_profit"], dtype=object)
+
+_QUANTITY_BINS = np.array([2, 5])
+_QUANTITY_LABELS = np.array(["small", "medium", "large"], dtype=object)
+_AVAILABILITY_DESCRIPTIONS = np.array(["Limited stock available", "Moderate availability", "Good stock availability"], dtype=object)
+
 class EcommerceDataLoader:
     """Load and process e-commerce order data for RAG system"""
     
-    def __init__(self, data_file: str = None):
+    def __init__(self, data_file: str = None, force_rebuild: bool = False):
         """Initialize the data loader"""
         self.data_file = data_file or Config.DATA_FILE
-        self.data = None
+        self.cache_file = f"{self.data_file}.processed.arrow"
+        self.force_rebuild = force_rebuild
+        self.table = None
+        self._data = None
+    
+    @property
+    def data(self) -> "pd.DataFrame":
+        """Loaded data as a pandas DataFrame, converted lazily from the Arrow table"""
+        if self.table is None:
+            return None
+        if self._data is None:
+            self._data = self.table.to_pandas()
+        return self._data
         
-    def load_data(self) -> pd.DataFrame:
-        """Load CSV data into a pandas DataFrame"""
+    def load_data(self) -> pa.Table:
+        """Load CSV data into an Arrow table"""
         try:
-            logger.info(f"Loading data from file: {self.data_file}")
-            self.data = pd.read_csv(self.data_file)
-            logger.info(f"Successfully loaded {len(self.data)} rows from CSV file")
-            logger.info(f"Data columns: {list(self.data.columns)}")
-            return self.data
+            logger.info("Loading data from file: %s", self.data_file)
+            self.table = pacsv.read_csv(
+                self.data_file,
+                read_options=pacsv.ReadOptions(use_threads=True, block_size=1 << 20),
+                convert_options=pacsv.ConvertOptions(column_types={
+                    "Order ID": pa.string(),
+                    "Amount": pa.float64(),
+                    "Profit": pa.float64(),
+                    "Quantity": pa.int64(),
+                    "Category": pa.string(),
+                    "Sub-Category": pa.string()
+                })
+            )
+            self._data = None
+            logger.info("Successfully loaded %d rows from CSV file", self.table.num_rows)
+            logger.info("Data columns: %s", self.table.column_names)
+            return self.table
         except FileNotFoundError:
-            logger.error(f"Data file not found: {self.data_file}")
+            logger.error("Data file not found: %s", self.data_file)
             raise
         except Exception as e:
-            logger.error(f"Error loading data: {e}")
-            logger.error(f"Error type: {type(e).__name__}")
+            logger.error("Error loading data: %s", e)
+            logger.error("Error type: %s", type(e).__name__)
             raise
     
-    def process_data(self) -> List[Dict[str, Any]]:
-        """Process the data and convert to documents for indexing"""
+    def process_data(self) -> pa.Table:
+        """Process the data and convert to a table of documents for indexing"""
         logger.info("Starting data processing for indexing")
         
-        if self.data is None:
+        documents_table = None if self.force_rebuild else self._load_cached_documents()
+        if documents_table is None:
+            documents_table = self._build_documents_table()
+            self._save_cached_documents(documents_table)
+        
+        logger.info("Successfully processed %d documents", documents_table.num_rows)
+        logger.info("Sample document ID: %s", documents_table.column('id')[0] if documents_table.num_rows else 'None')
+        
+        return documents_table
+    
+    def _build_documents_table(self) -> pa.Table:
+        """Build the documents for indexing as an Arrow table"""
+        if self.table is None:
             logger.info("Data not loaded, loading data first")
             self.load_data()
         
-        documents = []
-        logger.info(f"Processing {len(self.data)} rows into documents")
+        logger.info("Processing %d rows into documents", self.table.num_rows)
         
-        for index, row in self.data.iterrows():
-            doc = {
-                "id": f"order_{index}",
-                "order_id": str(row["Order ID"]),
-                "amount": float(row["Amount"]),
-                "profit": float(row["Profit"]),
-                "quantity": int(row["Quantity"]),
-                "category": str(row["Category"]),
-                "sub_category": str(row["Sub-Category"]),
-                "content": self._create_consumer_friendly_content(row),
-                "business_content": self._create_business_content(row),
-                "amount_range": self._get_amount_range(row["Amount"]),
-                "profit_range": self._get_profit_range(row["Profit"]),
-                "quantity_range": self._get_quantity_range(row["Quantity"])
-            }
-            documents.append(doc)
+        # Work on whole Arrow columns at once instead of materializing each row
+        order_id = self._column("Order ID")
+        amount = self._column("Amount")
+        profit = self._column("Profit")
+        quantity = self._column("Quantity")
+        category_values, category_codes = self._dictionary_column("Category")
+        sub_category_values, sub_category_codes = self._dictionary_column("Sub-Category")
         
-        logger.info(f"Successfully processed {len(documents)} documents")
-        logger.info(f"Sample document ID: {documents[0]['id'] if documents else 'None'}")
+        # Bucket indices are shared by the range labels and the content descriptions
+        amount_bucket = np.searchsorted(_AMOUNT_BINS, amount, side="right")
+        profit_bucket = np.searchsorted(_PROFIT_BINS, profit, side="right")
+        quantity_bucket = np.searchsorted(_QUANTITY_BINS, quantity, side="left")
         
-        return documents
-    
-    def _create_consumer_friendly_content(self, row: pd.Series) -> str:
-        """Create consumer-friendly content without business metrics"""
-        product_name = str(row['Sub-Category'])
-        category = str(row['Category'])
-        amount = float(row['Amount'])
-        quantity = int(row['Quantity'])
+        # The product prefix only depends on (sub-category, category), so format it
+        # once per distinct pair and look it up by pair code
+        pair_codes = sub_category_codes * len(category_values) + category_codes
+        unique_pairs, pair_index = np.unique(pair_codes, return_inverse=True)
+        product_prefixes = ("Product: " + sub_category_values[unique_pairs // len(category_values)]
+                            + " from " + category_values[unique_pairs % len(category_values)]
+                            + " category. Price: $")
+        product_prefix = product_prefixes[pair_index]
         
-        price_description = self._get_consumer_price_description(amount)
-        quality_description = self._get_consumer_quality_description(amount)
-        availability_description = self._get_consumer_availability_description(quantity)
+        price_text = np.char.mod("%.2f", amount).astype(object)
+        quantity_text = quantity.astype(str).astype(object)
         
-        return f"Product: {product_name} from {category} category. Price: ${amount:.2f}, Quantity available: {quantity}. This is a {price_description} item with {quality_description} quality. {availability_description}."
+        return pa.table({
+            "id": "order_" + np.arange(self.table.num_rows).astype(str).astype(object),
+            "order_id": order_id,
+            "amount": amount,
+            "profit": profit,
+            "quantity": quantity,
+            "category": category_values[category_codes],
+            "sub_category": sub_category_values[sub_category_codes],
+            "content": self._create_consumer_friendly_content(product_prefix, price_text, quantity_text,
+                                                              amount_bucket, quantity_bucket),
+            "business_content": self._create_business_content(product_prefix, price_text, quantity_text,
+                                                              profit, amount_bucket),
+            "amount_range": _AMOUNT_LABELS[amount_bucket],
+            "profit_range": _PROFIT_LABELS[profit_bucket],
+            "quantity_range": _QUANTITY_LABELS[quantity_bucket]
+        })
     
-    def _create_business_content(self, row: pd.Series) -> str:
-        """Create business-focused content with profit metrics"""
-        product_name = str(row['Sub-Category'])
-        category = str(row['Category'])
-        amount = float(row['Amount'])
-        profit = float(row['Profit'])
-        quantity = int(row['Quantity'])
-        
-        profit_description = self._get_profit_description(profit)
-        amount_range = self._get_amount_range(amount)
-        
-        return f"Product: {product_name} from {category} category. Price: ${amount:.2f}, Profit: ${profit:.2f}, Quantity available: {quantity}. This is a {amount_range}-priced item with {profit_description}."
-            
-    def _get_consumer_price_description(self, amount: float) -> str:
-        """Get consumer-friendly price description"""
-        if amount < 100:
-            return "affordable"
-        elif amount < 500:
-            return "mid-range"
-        else:
-            return "premium"
+    def _source_mtime(self) -> bytes:
+        """Cache key for the processed documents, based on the CSV modification time"""
+        return str(os.stat(self.data_file).st_mtime_ns).encode()
     
-    def _get_consumer_quality_description(self, amount: float) -> str:
-        """Get consumer-friendly quality description based on price"""
-        if amount < 100:
-            return "good value"
-        elif amount < 500:
-            return "high quality"
-        else:
-            return "luxury"
+    def _load_cached_documents(self) -> pa.Table:
+        """Load processed documents from the Feather cache if it is up to date"""
+        if not os.path.exists(self.cache_file):
+            return None
+        try:
+            # Only the file footer is read here, so a stale cache is rejected without
+            # decompressing its record batches
+            with pa.memory_map(self.cache_file) as source:
+                metadata = pa.ipc.open_file(source).schema.metadata or {}
+            if (metadata.get(b"source_mtime") != self._source_mtime()
+                    or metadata.get(b"format_version") != _DOCUMENTS_FORMAT_VERSION):
+                logger.info("Cached documents are stale: %s", self.cache_file)
+                return None
+            documents_table = feather.read_table(self.cache_file)
+            logger.info("Loaded %d cached documents from: %s", documents_table.num_rows, self.cache_file)
+            return documents_table
+        except Exception as e:
+            logger.warning("Could not read cached documents: %s", e)
+            return None
     
-    def _get_consumer_availability_description(self, quantity: int) -> str:
-        """Get consumer-friendly availability description"""
-        if quantity <= 2:
-            return "Limited stock available"
-        elif quantity <= 5:
-            return "Moderate availability"
-        else:
-            return "Good stock availability"
+    def _save_cached_documents(self, documents_table: pa.Table):
+        """Write processed documents to the Feather cache"""
+        try:
+            documents_table = documents_table.replace_schema_metadata({
+                "source_mtime": self._source_mtime(),
+                "format_version": _DOCUMENTS_FORMAT_VERSION
+            })
+            feather.write_feather(documents_table, self.cache_file, compression="lz4")
+            logger.info("Cached processed documents to: %s", self.cache_file)
+        except Exception as e:
+            logger.warning("Could not cache processed documents: %s", e)
     
-    def _get_amount_range(self, amount: float) -> str:
-        """Categorize amount into ranges"""
-        if amount < 100:
-            return "low"
-        elif amount < 500:
-            return "medium"
-        else:
-            return "high"
+    def _column(self, name: str) -> np.ndarray:
+        """Get a column of the loaded table as a NumPy array"""
+        return self.table.column(name).to_numpy(zero_copy_only=False)
     
-    def _get_profit_range(self, profit: float) -> str:
-        """Categorize profit into ranges"""
-        if profit < 0:
-            return "loss"
-        elif profit < 50:
-            return "low_profit"
-        else:
-            return "high_profit"
+    def _dictionary_column(self, name: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Get a string column as its interned distinct values and per-row codes into them"""
+        encoded = self.table.column(name).combine_chunks().dictionary_encode()
+        values = np.array([sys.intern(value) for value in encoded.dictionary.to_pylist()], dtype=object)
+        return values, encoded.indices.to_numpy(zero_copy_only=False).astype(np.int64)
     
-    def _get_quantity_range(self, quantity: int) -> str:
-        """Categorize quantity into ranges"""
-        if quantity <= 2:
-            return "small"
-        elif quantity <= 5:
-            return "medium"
-        else:
-            return "large"
+    def _create_consumer_friendly_content(self,
+                                          product_prefix: np.ndarray,
+                                          price_text: np.ndarray,
+                                          quantity_text: np.ndarray,
+                                          amount_bucket: np.ndarray,
+                                          quantity_bucket: np.ndarray) -> np.ndarray:
+        """Create consumer-friendly content without business metrics"""
+        return (product_prefix + price_text
+                + ", Quantity available: " + quantity_text
+                + ". This is a " + _PRICE_DESCRIPTIONS[amount_bucket]
+                + " item with " + _QUALITY_DESCRIPTIONS[amount_bucket]
+                + " quality. " + _AVAILABILITY_DESCRIPTIONS[quantity_bucket] + ".")
     
-    def _get_profit_description(self, profit: float) -> str:
-        """Get a neutral description of profit status"""
-        if profit > 0:
-            return "positive profitability"
-        elif profit < 0:
-            return "negative profitability"
-        else:
-            return "break-even"
+    def _create_business_content(self,
+                                 product_prefix: np.ndarray,
+                                 price_text: np.ndarray,
+                                 quantity_text: np.ndarray,
+                                 profit: np.ndarray,
+                                 amount_bucket: np.ndarray) -> np.ndarray:
+        """Create business-focused content with profit metrics"""
+        # Blank profits arrive as NaN, which falls through to break-even
+        profit_description = np.select(
+            [profit > 0, profit < 0],
+            ["positive profitability", "negative profitability"],
+            default="break-even"
+        ).astype(object)
+        
+        return (product_prefix + price_text
+                + ", Profit: $" + np.char.mod("%.2f", profit).astype(object)
+                + ", Quantity available: " + quantity_text
+                + ". This is a " + _AMOUNT_LABELS[amount_bucket]
+                + "-priced item with " + profit_description + ".")
     
 if __name__ == "__main__":
     loader = EcommerceDataLoader()
     documents = loader.process_data()
     
-    print(f"Processed {len(documents)} documents")
+    print(f"Processed {documents.num_rows} documents")
     print("\nSample document:")
-    print(json.dumps(documents[0], indent=2)) 
\ No newline at end of file
+    print(orjson.dumps(documents.slice(0, 1).to_pylist()[0], option=orjson.OPT_INDENT_2).decode()) 
\ No newline at end of file
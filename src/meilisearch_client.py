@@ -1,12 +1,32 @@
 
 import meilisearch
+import requests
+from requests.adapters import HTTPAdapter
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Callable, FrozenSet, TYPE_CHECKING
 import json
+import orjson
+from meilisearch.errors import MeilisearchTimeoutError
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from config import Config
+from utils import ttl_cache, query_tokens
+
+if TYPE_CHECKING:
+    import pyarrow as pa
 logger = logging.getLogger(__name__)
 
+_CATEGORIES = ('electronics', 'furniture', 'clothing')
+
+# Terms are matched as whole tokens, so comparative and superlative forms are listed explicitly
+_LOW_PRICE_TERMS = frozenset({'cheap', 'cheaper', 'cheapest', 'affordable', 'budget', 'low', 'lower', 'lowest'})
+_HIGH_PRICE_TERMS = frozenset({'expensive', 'luxury', 'premium', 'high', 'higher', 'highest'})
+_MID_PRICE_TERMS = frozenset({'mid', 'medium'})
+
+_RETRIEVED_ATTRIBUTES = [
+    'id', 'order_id', 'content', 'business_content', 'category', 'sub_category', 'amount', 'profit', 'quantity'
+]
+
 class MeilisearchClient:
     """Client for interacting with Meilisearch"""
     
@@ -16,7 +36,7 @@ class MeilisearchClient:
         self.url = url or Config.MEILISEARCH_URL
         self.master_key = master_key or Config.MEILISEARCH_MASTER_KEY
 
-        logger.info(f"Connecting to Meilisearch at: {self.url}")
+        logger.info("Connecting to Meilisearch at: %s", self.url)
         if self.master_key:
             logger.info("Using master key for authentication")
             self.client = meilisearch.Client(self.url, self.master_key)
@@ -24,15 +44,22 @@ class MeilisearchClient:
             logger.info("Connecting without master key")
             self.client = meilisearch.Client(self.url)
         
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=Config.HTTP_POOL_SIZE, pool_maxsize=Config.HTTP_POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._use_session(self.client)
+        
         self.index_name = Config.INDEX_NAME
-        logger.info(f"Using index name: {self.index_name}")
+        logger.info("Using index name: %s", self.index_name)
         self.index = None
+        self._fallback_docs = None
         logger.info("Meilisearch client initialized successfully")
         
     def create_index(self) -> bool:
         """Create the index if it doesn't exist"""
         try:
-            logger.info(f"Creating index: {self.index_name}")
+            logger.info("Creating index: %s", self.index_name)
             
             self.client.create_index(
                 uid=self.index_name,
@@ -41,70 +68,120 @@ class MeilisearchClient:
                 }
             )
             
-            self.index = self.client.index(self.index_name)
+            self._bind_index()
             
-            logger.info(f"Index '{self.index_name}' created successfully")
+            logger.info("Index '%s' created successfully", self.index_name)
             return True
             
         except Exception as e:
             if "already exists" in str(e).lower():
-                logger.info(f"Index '{self.index_name}' already exists")
-                self.index = self.client.index(self.index_name)
+                logger.info("Index '%s' already exists", self.index_name)
+                self._bind_index()
                 return True
             else:
-                logger.error(f"Error creating index: {e}")
+                logger.error("Error creating index: %s", e)
                 raise
     
     def delete_index(self) -> bool:
         """Delete the index if it exists"""
         try:
-            logger.info(f"Deleting index: {self.index_name}")
+            logger.info("Deleting index: %s", self.index_name)
             self.client.delete_index(self.index_name)
-            logger.info(f"Index '{self.index_name}' deleted successfully")
+            logger.info("Index '%s' deleted successfully", self.index_name)
             return True
         except Exception as e:
-            logger.error(f"Error deleting index: {e}")
+            logger.error("Error deleting index: %s", e)
             return False
     
     def get_or_create_index(self):
         """Get existing index or create new one"""
         try:
-            self.index = self.client.index(self.index_name)
+            self._bind_index()
         except Exception:
             self.create_index()
     
-    def add_documents(self, documents: List[Dict[str, Any]]) -> bool:
-        """Add documents to the index"""
+    def _bind_index(self):
+        """Bind the index handle, sharing the pooled HTTP session"""
+        self.index = self.client.index(self.index_name)
+        self._use_session(self.index)
+    
+    def _use_session(self, target):
+        """Route a Meilisearch SDK object's HTTP requests through the pooled session"""
+        # The SDK calls module-level requests.get/post/... which open a new
+        # connection per request; swap in the session's methods of the same name
+        for http in (target.http, target.task_handler.http):
+            send_request = http.send_request
+            
+            def pooled_send_request(http_method, *args, _send_request=send_request, **kwargs):
+                session_method = getattr(self.session, http_method.__name__, http_method)
+                return _send_request(session_method, *args, **kwargs)
+            
+            http.send_request = pooled_send_request
+    
+    def add_documents(self,
+                      documents: List[Dict[str, Any]],
+                      batch_size: int = 1000,
+                      max_workers: int = 8) -> bool:
+        """Add documents to the index. Returns False if any indexing task failed or did not finish in time"""
+        logger.info("Adding %d documents to index", len(documents))
+        
+        batches = (documents[i:i + batch_size] for i in range(0, len(documents), batch_size))
+        return self._add_batches(batches, lambda batch: batch, max_workers)
+    
+    def add_table(self,
+                  table: "pa.Table",
+                  chunk_rows: int = 1000,
+                  max_workers: int = 8) -> bool:
+        """Add documents from an Arrow table, converting only one chunk per upload to Python objects.
+        Returns False if any indexing task failed or did not finish in time"""
+        logger.info("Adding %d documents to index", table.num_rows)
+        
+        # Slices are zero-copy views; each worker converts its own chunk
+        chunks = (table.slice(i, chunk_rows) for i in range(0, table.num_rows, chunk_rows))
+        return self._add_batches(chunks, lambda chunk: chunk.to_pylist(), max_workers)
+    
+    def _add_batches(self,
+                     batches: Iterable[Any],
+                     to_documents: Callable[[Any], List[Dict[str, Any]]],
+                     max_workers: int) -> bool:
+        """Upload batches concurrently and wait for indexing to complete"""
         try:
-            logger.info(f"Adding {len(documents)} documents to index")
-            
             if not self.index:
                 self.get_or_create_index()
             
-            batch_size = 100 
-            for i in range(0, len(documents), batch_size):
-                batch = documents[i:i + batch_size]
-                self.index.add_documents(batch)
-                import time
-                time.sleep(0.1)
+            def upload(batch):
+                # Encode with orjson and hand the SDK raw bytes so it skips its own json.dumps
+                return self.index.add_documents_json(orjson.dumps(to_documents(batch)))
+            
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(upload, batch) for batch in batches]
+                task_uids = [future.result().task_uid for future in as_completed(futures)]
             
+            self._fallback_docs = None
             logger.info("All batches added, waiting for indexing to complete")
-        
-            import time
-            max_wait = 30 
-            wait_time = 0
-            while wait_time < max_wait:
-                stats = self.get_index_stats()
-                if not stats.get('isIndexing', False):
-                    logger.info(f"Indexing completed after {wait_time} seconds")
-                    break
-                time.sleep(1)
-                wait_time += 1
             
+            max_wait_ms = 60000
+            failed_tasks = 0
+            for task_uid in sorted(task_uids):
+                try:
+                    task = self.client.wait_for_task(task_uid, timeout_in_ms=max_wait_ms)
+                except MeilisearchTimeoutError:
+                    logger.error("Indexing task %d did not finish within %d ms, indexing not confirmed",
+                                 task_uid, max_wait_ms)
+                    return False
+                if task.status == 'failed':
+                    failed_tasks += 1
+                    logger.error("Indexing task %d failed: %s", task_uid, task.error)
+            
+            if failed_tasks:
+                logger.error("%d of %d indexing tasks failed", failed_tasks, len(task_uids))
+                return False
+            
+            logger.info("Indexing completed for %d tasks", len(task_uids))
             return True
             
         except Exception as e:
-            logger.error(f"Error adding documents: {e}")
+            logger.error("Error adding documents: %s", e)
             raise
     
     def configure_search_settings(self):
@@ -139,7 +216,7 @@ class MeilisearchClient:
             ])
             
         except Exception as e:
-            logger.error(f"Error configuring search settings: {e}")
+            logger.error("Error configuring search settings: %s", e)
             raise
     
     def search(self, query: str, limit: int = None, filters: str = None) -> Dict[str, Any]:
@@ -158,45 +235,66 @@ class MeilisearchClient:
             
             results = self.index.search(query, opt_params)
             
-            logger.info(f"Search completed - found {len(results.get('hits', []))} results")
-            logger.info(f"Search processing time: {results.get('processingTimeMs', 0)}ms")
+            logger.info("Search completed - found %d results", len(results.get('hits', [])))
+            logger.info("Search processing time: %sms", results.get('processingTimeMs', 0))
             
             return results
             
         except Exception as e:
-            logger.error(f"Error searching: {e}")
+            logger.error("Error searching: %s", e)
             raise
     
-    def search_by_category(self, query: str, limit: int = None) -> Dict[str, Any]:
-        """Search documents by category with enhanced relevance"""
+    def multi_search(self, queries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Run several searches against the index in a single request"""
         try:
             if not self.index:
                 self.get_or_create_index()
             
-            opt_params = {
-                'limit': limit or 10,
-                'attributesToRetrieve': ['id', 'content', 'category', 'sub_category', 'amount', 'profit', 'quantity'],
-                'attributesToHighlight': ['category', 'sub_category'],
-                'attributesToCrop': ['content']
-            }
+            response = self.client.multi_search([
+                {'indexUid': self.index_name, **query} for query in queries
+            ])
+            results = response.get('results', [])
             
-            if any(cat.lower() in query.lower() for cat in ['electronics', 'furniture', 'clothing']):
-                category_filter = None
-                for cat in ['electronics', 'furniture', 'clothing']:
-                    if cat.lower() in query.lower():
-                        category_filter = f"category = '{cat}'"
-                        break
-                
-                if category_filter:
-                    opt_params['filter'] = category_filter
+            logger.info("Multi-search completed - ran %d queries", len(results))
+            return results
             
-            results = self.index.search(query, opt_params)
+        except Exception as e:
+            logger.error("Error in multi-search: %s", e)
+            raise
+    
+    def category_search_params(self,
+                               query: str,
+                               limit: int = None,
+                               tokens: FrozenSet[str] = None) -> Dict[str, Any]:
+        """Build search parameters for a category-focused search"""
+        opt_params = {
+            'limit': limit or 10,
+            'attributesToRetrieve': _RETRIEVED_ATTRIBUTES,
+            'attributesToHighlight': ['category', 'sub_category'],
+            'attributesToCrop': ['content']
+        }
+        
+        tokens = query_tokens(query) if tokens is None else tokens
+        for cat in _CATEGORIES:
+            if cat in tokens:
+                opt_params['filter'] = f"category = '{cat}'"
+                break
+        
+        return opt_params
+    
+    def search_by_category(self, query: str, limit: int = None) -> Dict[str, Any]:
+        """Search documents by category with enhanced relevance"""
+        try:
+            if not self.index:
+                self.get_or_create_index()
             
-            logger.info(f"Category search completed - found {len(results.get('hits', []))} results")
+            results = self.index.search(query, self.category_search_params(query, limit))
+            
+            logger.info("Category search completed - found %d results", len(results.get('hits', [])))
             return results
             
         except Exception as e:
-            logger.error(f"Error in category search: {e}")
+            logger.error("Error in category search: %s", e)
             return self.search(query, limit)
     
     def search_by_price_range(self, query: str, limit: int = None) -> Dict[str, Any]:
@@ -207,26 +305,49 @@ class MeilisearchClient:
             
             opt_params = {
                 'limit': limit or 10,
-                'attributesToRetrieve': ['id', 'content', 'category', 'sub_category', 'amount', 'profit', 'quantity'],
+                'attributesToRetrieve': _RETRIEVED_ATTRIBUTES,
                 'sort': ['amount:asc']
             }
             
-            if any(word in query.lower() for word in ['cheap', 'affordable', 'budget', 'low']):
+            tokens = query_tokens(query)
+            if not _LOW_PRICE_TERMS.isdisjoint(tokens):
                 opt_params['filter'] = 'amount < 100'
-            elif any(word in query.lower() for word in ['expensive', 'luxury', 'premium', 'high']):
+            elif not _HIGH_PRICE_TERMS.isdisjoint(tokens):
                 opt_params['filter'] = 'amount >= 500'
-            elif any(word in query.lower() for word in ['mid', 'medium']):
+            elif not _MID_PRICE_TERMS.isdisjoint(tokens):
                 opt_params['filter'] = 'amount >= 100 AND amount < 500'
             
             results = self.index.search(query, opt_params)
             
-            logger.info(f"Price range search completed - found {len(results.get('hits', []))} results")
+            logger.info("Price range search completed - found %d results", len(results.get('hits', [])))
             return results
             
         except Exception as e:
-            logger.error(f"Error in price range search: {e}")
+            logger.error("Error in price range search: %s", e)
             return self.search(query, limit)    
     
+    def get_fallback_documents(self) -> List[Dict[str, Any]]:
+        """Get the first documents of the index, fetched once and reused for fallback results"""
+        if self._fallback_docs:
+            return self._fallback_docs
+        
+        try:
+            if not self.index:
+                self.get_or_create_index()
+            
+            documents = self.index.get_documents({
+                'limit': Config.MAX_SEARCH_RESULTS,
+                'fields': _RETRIEVED_ATTRIBUTES
+            })
+            self._fallback_docs = [dict(doc) for doc in documents.results]
+            
+            logger.info("Cached %d fallback documents", len(self._fallback_docs))
+            return self._fallback_docs
+            
+        except Exception as e:
+            logger.warning("Could not get fallback documents: %s", e)
+            return []
+    
     def get_index_stats(self) -> Dict[str, Any]:
         """Get index statistics"""
         try:
@@ -255,7 +376,7 @@ class MeilisearchClient:
                 }
             
         except Exception as e:
-            logger.warning(f"Could not get index stats: {e}")
+            logger.warning("Could not get index stats: %s", e)
             return {
                 'numberOfDocuments': 0,
                 'databaseSize': 0,
@@ -263,13 +384,14 @@ class MeilisearchClient:
                 'updateId': 0
             }
     
+    @ttl_cache(Config.CONNECTION_CHECK_TTL)
     def health_check(self) -> bool:
         """Check if Meilisearch is running"""
         try:
             health = self.client.health()
             return True
         except Exception as e:
-            logger.error(f"Meilisearch health check failed: {e}")
+            logger.error("Meilisearch health check failed: %s", e)
             return False
 
 if __name__ == "__main__":
@@ -1,9 +1,8 @@
 import logging
-from typing import Dict, Any, List
-from openai import OpenAI
-from openai.types.chat import ChatCompletion
+from typing import Dict, Any, List, AsyncIterator
 
 from config import Config
+from utils import ttl_cache, PERSONAL_KEYWORDS, BUSINESS_KEYWORDS
 from prompts import E_COMMERCE_SYSTEM_PROMPT, RAG_USER_PROMPT_TEMPLATE
 
 logger = logging.getLogger(__name__)
@@ -21,15 +20,33 @@ class OpenRouterClient:
             logger.error("OpenRouter API key is missing")
             raise ValueError("OpenRouter API key is required")
         
-        logger.info(f"Using OpenRouter base URL: {self.base_url}")
+        logger.info("Using OpenRouter base URL: %s", self.base_url)
+        
+        # Imported here so that importing this module does not pull in the SDK
+        import httpx
+        from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+        
+        default_headers = {
+            "HTTP-Referer": "https://agentic-rag-system.com",
+            "X-Title": "Agentic RAG System"
+        }
+        
+        limits = httpx.Limits(
+            max_connections=Config.HTTP_POOL_SIZE,
+            max_keepalive_connections=Config.HTTP_POOL_SIZE
+        )
         
         self.client = OpenAI(
             api_key=self.api_key,
             base_url=self.base_url,
-            default_headers={
-                "HTTP-Referer": "https://agentic-rag-system.com",
-                "X-Title": "Agentic RAG System"
-            }
+            default_headers=default_headers,
+            http_client=DefaultHttpxClient(limits=limits, timeout=Config.HTTP_TIMEOUT)
+        )
+        self.async_client = AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            default_headers=default_headers,
+            http_client=DefaultAsyncHttpxClient(limits=limits, timeout=Config.HTTP_TIMEOUT)
         )
         logger.info("OpenRouter client initialized successfully")
     
@@ -42,7 +59,7 @@ class OpenRouterClient:
         try:
             model = model or Config.LLM_MODEL
             
-            logger.info(f"Generating response with model: {model}")
+            logger.info("Generating response with model: %s", model)
             
             response = self.client.chat.completions.create(
                 model=model,
@@ -66,28 +83,56 @@ class OpenRouterClient:
             return result
             
         except Exception as e:
-            logger.error(f"Error generating response: {e}")
+            logger.error("Error generating response: %s", e)
+            raise
+    
+    async def generate_response_stream(self, 
+                                       messages: List[Dict[str, str]], 
+                                       model: str = None,
+                                       temperature: float = 0.7,
+                                       max_tokens: int = 1000) -> AsyncIterator[str]:
+        """Stream response content from OpenRouter API as it is generated"""
+        try:
+            model = model or Config.LLM_MODEL
+            
+            logger.info("Streaming response with model: %s", model)
+            
+            stream = await self.async_client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                timeout=10.0,
+                stream=True
+            )
+            
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+            
+            logger.info("Response streamed successfully")
+            
+        except Exception as e:
+            logger.error("Error streaming response: %s", e)
             raise
     
     def create_rag_prompt(self, query: str, context: List[Dict[str, Any]]) -> List[Dict[str, str]]:
         """Create a prompt for RAG system"""
-        logger.info(f"Creating RAG prompt for query: {query}")
-        logger.info(f"No. of context documents: {len(context)}")
+        logger.info("Creating RAG prompt for query: %s", query)
+        logger.info("No. of context documents: %s", len(context))
     
         # Detect context automatically
         is_personal_context = self._detect_personal_context(query)
-        logger.info(f"Detected context: {'PERSONAL' if is_personal_context else 'BUSINESS'}")
+        logger.info("Detected context: %s", 'PERSONAL' if is_personal_context else 'BUSINESS')
         
-        context_text = ""
-        for i, doc in enumerate(context, 1):
-            if is_personal_context:
-                content = doc.get('content', '')
-            else:
-                content = doc.get('business_content', doc.get('content', ''))
-            
-            context_text += f"{i}. {content}\n"
+        if is_personal_context:
+            contents = (doc.get('content', '') for doc in context)
+        else:
+            contents = (doc.get('business_content', doc.get('content', '')) for doc in context)
         
-        logger.info(f"Context text length: {len(context_text)} characters")
+        context_text = "".join(f"{i}. {content}\n" for i, content in enumerate(contents, 1))
+        
+        logger.info("Context text length: %d characters", len(context_text))
         
         user_prompt = RAG_USER_PROMPT_TEMPLATE.format(
             context_text=context_text,
@@ -99,8 +144,7 @@ class OpenRouterClient:
             {"role": "user", "content": user_prompt}
         ]
         
-        logger.info(f"Created prompt with {len(messages)} messages")
-        logger.info(f"Total prompt length: {len(str(messages))} characters")
+        logger.info("Created prompt with %d messages", len(messages))
         
         return messages
     
@@ -108,25 +152,8 @@ class OpenRouterClient:
         """Automatically detect if the query is for personal shopping context"""
         query_lower = query.lower()
         
-        personal_keywords = [
-            'shopping', 'buy', 'buying', 'purchase', 'purchasing',
-            'gift', 'gifts', 'present', 'presents', 'souvenir', 'souvenirs',
-            'vacation', 'travel', 'trip', 'holiday', 'goa', 'beach',
-            'personal', 'family', 'friends', 'myself', 'me',
-            'recommend', 'recommendation', 'suggest', 'suggestion',
-            'what to buy', 'what should i buy', 'what can i take',
-            'need', 'want', 'looking for', 'searching for'
-        ]
-        
-        business_keywords = [
-            'business', 'profit', 'profitability', 'revenue', 'loss',
-            'margin', 'margins', 'analysis', 'analytics', 'performance',
-            'inventory', 'stock', 'quarterly', 'annual', 'strategy',
-            'management', 'optimization', 'efficiency', 'roi'
-        ]
-        
-        personal_matches = sum(1 for keyword in personal_keywords if keyword in query_lower)
-        business_matches = sum(1 for keyword in business_keywords if keyword in query_lower)
+        personal_matches = sum(1 for keyword in PERSONAL_KEYWORDS if keyword in query_lower)
+        business_matches = sum(1 for keyword in BUSINESS_KEYWORDS if keyword in query_lower)
         
         if business_matches > personal_matches and business_matches > 0:
             return False
@@ -150,21 +177,22 @@ class OpenRouterClient:
             return model_list
             
         except Exception as e:
-            logger.error(f"Error getting models: {e}")
+            logger.error("Error getting models: %s", e)
             return []
     
+    @ttl_cache(Config.CONNECTION_CHECK_TTL)
     def test_connection(self) -> bool:
         """Test the connection to OpenRouter"""
         try:
             models = self.get_available_models()
             if models:
-                logger.info(f"OpenRouter connection successful. Found {len(models)} models")
+                logger.info("OpenRouter connection successful. Found %d models", len(models))
                 return True
             else:
                 logger.error("No models found")
                 return False
         except Exception as e:
-            logger.error(f"Connection test failed: {e}")
+            logger.error("Connection test failed: %s", e)
             return False
 
 if __name__ == "__main__":
@@ -1,12 +1,16 @@
+import asyncio
 import logging
+import threading
 import time
-from typing import Dict, Any, List
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Callable, Tuple
 import json
 
 from config import Config
-from data_loader import EcommerceDataLoader
 from meilisearch_client import MeilisearchClient
 from openrouter_client import OpenRouterClient
+from utils import PERSONAL_KEYWORDS, BUSINESS_KEYWORDS, TOKEN_RE, query_tokens
 
 logging.basicConfig(
     level=getattr(logging, Config.LOG_LEVEL),
@@ -18,103 +22,158 @@ logging.getLogger('meilisearch_client').setLevel(logging.WARNING)
 logging.getLogger('data_loader').setLevel(logging.WARNING)
 logging.getLogger('openrouter_client').setLevel(logging.WARNING)
 
+_STOP_WORDS = frozenset({
+    'the', 'and', 'for', 'are', 'but', 'not', 'you', 'all', 'any', 'can',
+    'had', 'her', 'was', 'one', 'our', 'out', 'has', 'him', 'his', 'how',
+    'its', 'may', 'new', 'now', 'old', 'see', 'two', 'who', 'did', 'get',
+    'let', 'put', 'say', 'she', 'too', 'use', 'what', 'which', 'with',
+    'this', 'that', 'from', 'have', 'they', 'will', 'your', 'there', 'their',
+    'about', 'would', 'could', 'should', 'some', 'show', 'tell', 'give',
+    'find', 'list', 'much', 'many', 'more', 'most', 'than', 'then', 'them',
+    'these', 'those', 'into', 'also', 'just', 'only', 'very', 'when', 'where'
+})
+
+_COMMON_TERMS = ('electronics', 'furniture', 'clothing', 'phone', 'chair', 'saree')
+
 class AgenticRAGSystem:
     """Main RAG system for e-commerce data analysis"""
     
     def __init__(self):
         """Initialize the RAG system"""
-        self.data_loader = EcommerceDataLoader()
+        self._data_loader = None
         self.meilisearch_client = MeilisearchClient()
         self.openrouter_client = OpenRouterClient()
         
+        self._search_cache = OrderedDict()
+        self._search_cache_lock = threading.Lock()
+        
         Config.validate_config()
     
+    @property
+    def data_loader(self):
+        """Data loader, created on first use so the data stack is only imported when indexing"""
+        if self._data_loader is None:
+            from data_loader import EcommerceDataLoader
+            self._data_loader = EcommerceDataLoader()
+        return self._data_loader
+    
     def _smart_search(self, query: str, max_results: int, filters: str = None) -> Dict[str, Any]:
-        """Perform smart search with improved relevance"""
+        """Perform smart search with improved relevance, reusing recent results"""
+        cache_key = (query.lower().strip(), max_results, filters)
+        cached_results = self._get_cached_search(cache_key)
+        if cached_results is not None:
+            logger.info("Search results served from cache")
+            return cached_results
+        
         try:
-            results = self.meilisearch_client.search(query, max_results, filters)
+            direct_query = {'q': query, 'limit': max_results}
+            if filters:
+                direct_query['filter'] = filters
             
-            if results.get('hits') and len(results['hits']) >= max_results:
-                return results
+            # Direct, category, key-term and fallback-term searches go out in a
+            # single request, ordered by priority
+            candidate_terms = dict.fromkeys(self._extract_key_terms(query) + list(_COMMON_TERMS))
+            queries = [
+                direct_query,
+                {'q': query, **self.meilisearch_client.category_search_params(query, max_results, query_tokens(query))},
+                *[{'q': term, 'limit': max_results} for term in candidate_terms]
+            ]
             
-            if not results.get('hits') or len(results['hits']) < max_results:
-                try:
-                    category_results = self.meilisearch_client.search_by_category(query, max_results)
-                    if category_results.get('hits'):
-                        if results.get('hits'):
-                            combined_hits = results['hits'] + category_results['hits']
-                            seen_ids = set()
-                            unique_hits = []
-                            for hit in combined_hits:
-                                if hit.get('id') not in seen_ids:
-                                    unique_hits.append(hit)
-                                    seen_ids.add(hit.get('id'))
-                                if len(unique_hits) >= max_results:
-                                    break
-                            results['hits'] = unique_hits
-                        else:
-                            results = category_results
-                except Exception as e:
-                    logger.warning(f"Category search failed: {e}")
+            all_results = self._run_search_strategies(queries)
             
-            if not results.get('hits') or len(results['hits']) < max_results:
-                try:
-                    common_terms = ['electronics', 'furniture', 'clothing', 'phone', 'chair', 'saree']
-                    for term in common_terms:
-                        if len(results.get('hits', [])) >= max_results:
-                            break
-                        term_results = self.meilisearch_client.search(term, max_results - len(results.get('hits', [])))
-                        if term_results.get('hits'):
-                            if not results.get('hits'):
-                                results = term_results
-                            else:
-                                existing_ids = {hit.get('id') for hit in results['hits']}
-                                for hit in term_results['hits']:
-                                    if hit.get('id') not in existing_ids and len(results['hits']) < max_results:
-                                        results['hits'].append(hit)
-                except Exception as e:
-                    logger.warning(f"Fallback search failed: {e}")
+            results = dict(all_results[0]) if all_results else {}
+            seen_ids = set()
+            unique_hits = []
+            for result in all_results:
+                for hit in result.get('hits', []):
+                    if len(unique_hits) >= max_results:
+                        break
+                    if hit.get('id') not in seen_ids:
+                        unique_hits.append(hit)
+                        seen_ids.add(hit.get('id'))
+            if not unique_hits:
+                logger.info("No search strategy matched, using fallback documents")
+                unique_hits = self.meilisearch_client.get_fallback_documents()[:max_results]
+            results['hits'] = unique_hits
             
-            if not results.get('hits'):
-                results['hits'] = []
             if 'estimatedTotalHits' not in results:
                 results['estimatedTotalHits'] = len(results['hits'])
             if 'processingTimeMs' not in results:
                 results['processingTimeMs'] = 0
-                
+            
+            # Don't keep fallback documents served because every search failed
+            if all_results:
+                self._cache_search(cache_key, results)
             return results
             
         except Exception as e:
-            logger.error(f"Smart search failed: {e}")
+            logger.error("Smart search failed: %s", e)
             return {    
                 'hits': [],
                 'estimatedTotalHits': 0,
                 'processingTimeMs': 0
             }
     
+    def _run_search_strategies(self, queries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Run the search strategies as one multi-search, degrading when it fails.
+        
+        A single failing query (e.g. a category filter on a field that is not filterable yet)
+        fails the whole multi-search, so retry without the category query and then with only
+        the direct query. Returns an empty list if every attempt fails.
+        """
+        attempts = (queries, queries[:1] + queries[2:], queries[:1])
+        for attempt in attempts:
+            try:
+                return self.meilisearch_client.multi_search(attempt)
+            except Exception as e:
+                logger.warning("Multi-search with %d queries failed: %s", len(attempt), e)
+        return []
+    
+    def _get_cached_search(self, cache_key: tuple) -> Dict[str, Any]:
+        """Get cached search results if present and not expired"""
+        with self._search_cache_lock:
+            entry = self._search_cache.get(cache_key)
+            if entry is None:
+                return None
+            
+            timestamp, results = entry
+            if time.time() - timestamp > Config.SEARCH_CACHE_TTL:
+                del self._search_cache[cache_key]
+                return None
+            
+            self._search_cache.move_to_end(cache_key)
+            return {**results, 'hits': list(results['hits'])}
+    
+    def _cache_search(self, cache_key: tuple, results: Dict[str, Any]):
+        """Store search results, evicting the least recently used entry when full"""
+        with self._search_cache_lock:
+            self._search_cache[cache_key] = (time.time(), {**results, 'hits': list(results['hits'])})
+            self._search_cache.move_to_end(cache_key)
+            while len(self._search_cache) > Config.SEARCH_CACHE_SIZE:
+                self._search_cache.popitem(last=False)
+    
+    def clear_search_cache(self):
+        """Drop all cached search results"""
+        with self._search_cache_lock:
+            self._search_cache.clear()
+    
+    def _extract_key_terms(self, query: str) -> List[str]:
+        """Extract up to Config.MAX_KEY_TERMS distinct key terms from a query, dropping stop words"""
+        key_terms = []
+        for match in TOKEN_RE.finditer(query):
+            term = match.group(0).lower()
+            if term not in _STOP_WORDS and term not in key_terms:
+                key_terms.append(term)
+                if len(key_terms) >= Config.MAX_KEY_TERMS:
+                    break
+        return key_terms
+    
     def _detect_personal_context(self, query: str) -> bool:
         """Automatically detect if the query is for personal shopping context"""
         query_lower = query.lower()
         
-        personal_keywords = [
-            'shopping', 'buy', 'buying', 'purchase', 'purchasing',
-            'gift', 'gifts', 'present', 'presents', 'souvenir', 'souvenirs',
-            'vacation', 'travel', 'trip', 'holiday', 'goa', 'beach',
-            'personal', 'family', 'friends', 'myself', 'me',
-            'recommend', 'recommendation', 'suggest', 'suggestion',
-            'what to buy', 'what should i buy', 'what can i take',
-            'need', 'want', 'looking for', 'searching for'
-        ]
-        
-        business_keywords = [
-            'business', 'profit', 'profitability', 'revenue', 'loss',
-            'margin', 'margins', 'analysis', 'analytics', 'performance',
-            'inventory', 'stock', 'quarterly', 'annual', 'strategy',
-            'management', 'optimization', 'efficiency', 'roi'
-        ]
-        
-        personal_matches = sum(1 for keyword in personal_keywords if keyword in query_lower)
-        business_matches = sum(1 for keyword in business_keywords if keyword in query_lower)
+        personal_matches = sum(1 for keyword in PERSONAL_KEYWORDS if keyword in query_lower)
+        business_matches = sum(1 for keyword in BUSINESS_KEYWORDS if keyword in query_lower)
         
         if business_matches > personal_matches and business_matches > 0:
             return False
@@ -126,6 +185,8 @@ class AgenticRAGSystem:
         try:
             print("Initializing system...")
             
+            # Probe afresh instead of trusting a result cached by an earlier status check
+            MeilisearchClient.health_check.cache_clear(self.meilisearch_client)
             if not self.meilisearch_client.health_check():
                 logger.error("Meilisearch health check failed")
                 print("Error: Meilisearch is not running. Please start it first.")
@@ -143,14 +204,19 @@ class AgenticRAGSystem:
             print("Loading data...")
             documents = self.data_loader.process_data()
             
-            logger.info(f"Adding {len(documents)} documents to index")
-            self.meilisearch_client.add_documents(documents)
+            logger.info("Adding %d documents to index", documents.num_rows)
+            indexed = self.meilisearch_client.add_table(documents)
+            self.clear_search_cache()
+            if not indexed:
+                logger.error("Indexing failed or could not be confirmed")
+                print("Error: Indexing failed or did not finish in time. Check the Meilisearch task logs.")
+                return False
             
             print("System ready!")
             return True
             
         except Exception as e:
-            logger.error(f"System initialization failed: {e}")
+            logger.error("System initialization failed: %s", e)
             print(f"Error: {e}")
             raise
     
@@ -158,34 +224,17 @@ class AgenticRAGSystem:
               user_query: str, 
               max_results: int = None,
               filters: str = None,
-              model: str = None) -> Dict[str, Any]:
-        """Process a user query using RAG"""
+              model: str = None,
+              verbose: bool = False) -> Dict[str, Any]:
+        """Process a user query using RAG. Raw search hits are only returned as context when verbose"""
         try:
             start_time = time.time()
-            logger.info(f"Processing query: '{user_query}'")
-            
-            search_results = self._smart_search(user_query, max_results or Config.MAX_SEARCH_RESULTS, filters)
-            
-            search_time = time.time() - start_time
-            
-            if not search_results['hits']:
-                logger.warning("No relevant documents found for query")
-                return {
-                    "query": user_query,
-                    "answer": "I couldn't find any relevant data to answer your question. Please try rephrasing your query.",
-                    "context": [],
-                    "search_time": search_time,
-                    "llm_time": 0.0,
-                    "total_time": time.time() - start_time,
-                    "sources": [],
-                    "search_stats": {
-                        "total_hits": 0,
-                        "processing_time_ms": 0
-                    }
-                }
+            search_results, search_time, messages = self._prepare_query(user_query, max_results, filters, start_time)
+            
+            if messages is None:
+                return self._no_results_response(user_query, search_time, start_time, verbose)
             
             context_docs = search_results['hits']
-            messages = self.openrouter_client.create_rag_prompt(user_query, context_docs)
             
             llm_start_time = time.time()
             llm_response = self.openrouter_client.generate_response(
@@ -194,85 +243,201 @@ class AgenticRAGSystem:
                 temperature=0.3,
                 max_tokens=800
             )
-            
             llm_time = time.time() - llm_start_time
-            total_time = time.time() - start_time
             
             answer = llm_response['choices'][0]['message']['content']
+            sources = self._build_sources(context_docs, self._detect_personal_context(user_query))
             
-            is_personal_context = self._detect_personal_context(user_query)
-            
-            sources = []
-            for doc in context_docs:
-                if is_personal_context:
-                    content = doc.get('content', '')
-                else:
-                    content = doc.get('business_content', doc.get('content', ''))  # Business content
-                
-                sources.append({
-                    "order_id": doc.get("order_id"),
-                    "category": doc.get("category"),
-                    "sub_category": doc.get("sub_category"),
-                    "amount": doc.get("amount"),
-                    "profit": doc.get("profit") if not is_personal_context else None,  # Hide profit for personal context
-                    "content": content
-                })
-            
-            result = {
-                "query": user_query,
-                "answer": answer,
-                "context": context_docs,
-                "search_time": search_time,
-                "llm_time": llm_time,
-                "total_time": total_time,
-                "sources": sources,
-                "search_stats": {
-                    "total_hits": search_results.get('estimatedTotalHits', 0),
-                    "processing_time_ms": search_results.get('processingTimeMs', 0)
-                }
-            }
+            return self._query_result(user_query, answer, sources, search_results,
+                                      start_time, search_time, llm_time, verbose)
             
-            logger.info(f"Query completed in {total_time:.2f}s (search: {search_time:.2f}s, LLM: {llm_time:.2f}s)")
+        except Exception as e:
+            logger.error("Error processing query: %s", e)
+            raise
+    
+    async def aquery(self, 
+                     user_query: str, 
+                     max_results: int = None,
+                     filters: str = None,
+                     model: str = None,
+                     on_token: Callable[[str], None] = None,
+                     verbose: bool = False) -> Dict[str, Any]:
+        """Process a user query using RAG, streaming answer tokens to on_token as they arrive"""
+        try:
+            start_time = time.time()
+            loop = asyncio.get_running_loop()
+            search_results, search_time, messages = await loop.run_in_executor(
+                None, self._prepare_query, user_query, max_results, filters, start_time
+            )
+            
+            if messages is None:
+                result = self._no_results_response(user_query, search_time, start_time, verbose)
+                if on_token:
+                    on_token(result["answer"])
+                return result
+            
+            context_docs = search_results['hits']
             
-            return result
+            async def stream_answer() -> str:
+                chunks = []
+                async for chunk in self.openrouter_client.generate_response_stream(
+                    messages=messages,
+                    model=model,
+                    temperature=0.3,
+                    max_tokens=800
+                ):
+                    chunks.append(chunk)
+                    if on_token:
+                        on_token(chunk)
+                return "".join(chunks)
+            
+            # Sources are assembled off the event loop while the LLM streams
+            llm_start_time = time.time()
+            answer, sources = await asyncio.gather(
+                stream_answer(),
+                loop.run_in_executor(None, self._build_sources, context_docs,
+                                     self._detect_personal_context(user_query))
+            )
+            llm_time = time.time() - llm_start_time
+            
+            return self._query_result(user_query, answer, sources, search_results,
+                                      start_time, search_time, llm_time, verbose)
             
         except Exception as e:
-            logger.error(f"Error processing query: {e}")
+            logger.error("Error processing query: %s", e)
             raise
     
+    def _prepare_query(self,
+                       user_query: str,
+                       max_results: int,
+                       filters: str,
+                       start_time: float) -> Tuple[Dict[str, Any], float, List[Dict[str, str]]]:
+        """Search for context and build the LLM prompt.
+        
+        Returns the search results, the search time and the prompt messages, which are None
+        when no documents match the query.
+        """
+        logger.info("Processing query: '%s'", user_query)
+        
+        search_results = self._smart_search(user_query, max_results or Config.MAX_SEARCH_RESULTS, filters)
+        search_time = time.time() - start_time
+        
+        if not search_results['hits']:
+            logger.warning("No relevant documents found for query")
+            return search_results, search_time, None
+        
+        messages = self.openrouter_client.create_rag_prompt(user_query, search_results['hits'])
+        return search_results, search_time, messages
+    
+    def _query_result(self,
+                      user_query: str,
+                      answer: str,
+                      sources: List[Dict[str, Any]],
+                      search_results: Dict[str, Any],
+                      start_time: float,
+                      search_time: float,
+                      llm_time: float,
+                      verbose: bool = False) -> Dict[str, Any]:
+        """Build the response returned for an answered query"""
+        total_time = time.time() - start_time
+        
+        logger.info("Query completed in %.2fs (search: %.2fs, LLM: %.2fs)", total_time, search_time, llm_time)
+        
+        return {
+            "query": user_query,
+            "answer": answer,
+            "context": search_results['hits'] if verbose else None,
+            "search_time": search_time,
+            "llm_time": llm_time,
+            "total_time": total_time,
+            "sources": sources,
+            "search_stats": {
+                "total_hits": search_results.get('estimatedTotalHits', 0),
+                "processing_time_ms": search_results.get('processingTimeMs', 0)
+            }
+        }
+    
+    def _build_sources(self, context_docs: List[Dict[str, Any]], is_personal_context: bool) -> List[Dict[str, Any]]:
+        """Build the source list returned alongside an answer"""
+        if is_personal_context:
+            # Hide profit and business content for personal context
+            return [
+                {"order_id": doc.get("order_id"), "category": doc.get("category"),
+                 "sub_category": doc.get("sub_category"), "amount": doc.get("amount"),
+                 "profit": None, "content": doc.get("content", "")}
+                for doc in context_docs
+            ]
+        
+        return [
+            {"order_id": doc.get("order_id"), "category": doc.get("category"),
+             "sub_category": doc.get("sub_category"), "amount": doc.get("amount"),
+             "profit": doc.get("profit"), "content": doc.get("business_content", doc.get("content", ""))}
+            for doc in context_docs
+        ]
+    
+    def _no_results_response(self,
+                             user_query: str,
+                             search_time: float,
+                             start_time: float,
+                             verbose: bool = False) -> Dict[str, Any]:
+        """Build the response returned when no documents match a query"""
+        return {
+            "query": user_query,
+            "answer": "I couldn't find any relevant data to answer your question. Please try rephrasing your query.",
+            "context": [] if verbose else None,
+            "search_time": search_time,
+            "llm_time": 0.0,
+            "total_time": time.time() - start_time,
+            "sources": [],
+            "search_stats": {
+                "total_hits": 0,
+                "processing_time_ms": 0
+            }
+        }
+    
     def get_system_info(self) -> Dict[str, Any]:
         """Get system information and status"""
         try:
+            # Probe the services concurrently rather than one after another
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                meilisearch_healthy = executor.submit(self.meilisearch_client.health_check)
+                openrouter_healthy = executor.submit(self.openrouter_client.test_connection)
+                index_stats = executor.submit(self.meilisearch_client.get_index_stats)
+            
             info = {
                 "system": "Agentic RAG System",
                 "version": "1.0.0",
                 "components": {
                     "meilisearch": {
-                        "status": "healthy" if self.meilisearch_client.health_check() else "unhealthy",
+                        "status": "healthy" if meilisearch_healthy.result() else "unhealthy",
                         "url": self.meilisearch_client.url
                     },
                     "openrouter": {
-                        "status": "healthy" if self.openrouter_client.test_connection() else "unhealthy",
+                        "status": "healthy" if openrouter_healthy.result() else "unhealthy",
                         "model": Config.LLM_MODEL
                     }
                 }
             }
             
             try:
-                stats = self.meilisearch_client.get_index_stats()
-                info["index_stats"] = stats
+                info["index_stats"] = index_stats.result()
             except:
                 info["index_stats"] = "Not available"
             
             return info
             
         except Exception as e:
-            logger.error(f"Error getting system info: {e}")
+            logger.error("Error getting system info: %s", e)
             return {"error": str(e)}
 
 if __name__ == "__main__":
     import sys
     
+    def print_token(token: str):
+        print(token, end="", flush=True)
+    
+    loop = asyncio.new_event_loop()
+    
     try:
         rag = AgenticRAGSystem()
         
@@ -282,10 +447,10 @@ if __name__ == "__main__":
         
         if len(sys.argv) > 1:
             query = " ".join(sys.argv[1:])
-            print(f"\nQuery: {query}")
+            print(f"\nQuery: {query}\n")
             
-            result = rag.query(query)
-            print(f"\n{result['answer']}")
+            result = loop.run_until_complete(rag.aquery(query, on_token=print_token))
+            print()
             print(f"Response time: {result['total_time']:.1f}s")
             
         else:
@@ -302,8 +467,9 @@ if __name__ == "__main__":
                     if not query:
                         continue
                     
-                    result = rag.query(query)
-                    print(f"\n{result['answer']}")
+                    print()
+                    result = loop.run_until_complete(rag.aquery(query, on_token=print_token))
+                    print()
                     print(f"Response time: {result['total_time']:.1f}s")
                     print()
                     
@@ -315,4 +481,6 @@ if __name__ == "__main__":
                     
     except Exception as e:
         print(f"System initialization failed: {e}")
-        sys.exit(1) 
\ No newline at end of file
+        sys.exit(1)
+    finally:
+        loop.close() 
\ No newline at end of file
@@ -0,0 +1,63 @@
+import functools
+import re
+import threading
+import time
+from typing import Callable, FrozenSet
+
+TOKEN_RE = re.compile(r"[A-Za-z]{3,}")
+
+# Keywords used to tell personal shopping queries from business analysis queries
+PERSONAL_KEYWORDS = (
+    'shopping', 'buy', 'buying', 'purchase', 'purchasing',
+    'gift', 'gifts', 'present', 'presents', 'souvenir', 'souvenirs',
+    'vacation', 'travel', 'trip', 'holiday', 'goa', 'beach',
+    'personal', 'family', 'friends', 'myself', 'me',
+    'recommend', 'recommendation', 'suggest', 'suggestion',
+    'what to buy', 'what should i buy', 'what can i take',
+    'need', 'want', 'looking for', 'searching for'
+)
+
+BUSINESS_KEYWORDS = (
+    'business', 'profit', 'profitability', 'revenue', 'loss',
+    'margin', 'margins', 'analysis', 'analytics', 'performance',
+    'inventory', 'stock', 'quarterly', 'annual', 'strategy',
+    'management', 'optimization', 'efficiency', 'roi'
+)
+
+
+def query_tokens(query: str) -> FrozenSet[str]:
+    """Lowercased word tokens of a query, for set-membership term matching"""
+    return frozenset(TOKEN_RE.findall(query.lower()))
+
+
+def ttl_cache(seconds: float) -> Callable:
+    """Cache the truthy result of an argument-less method per instance for a number of seconds.
+    
+    Falsy results (e.g. a failed health probe) are not cached, so the next call retries.
+    """
+    def decorator(method: Callable) -> Callable:
+        cache_attr = f"_{method.__name__}_ttl_cache"
+        lock = threading.Lock()
+        
+        @functools.wraps(method)
+        def wrapper(self):
+            with lock:
+                cached = self.__dict__.get(cache_attr)
+                if cached is not None and time.monotonic() - cached[0] < seconds:
+                    return cached[1]
+            
+            result = method(self)
+            if result:
+                with lock:
+                    self.__dict__[cache_attr] = (time.monotonic(), result)
+            return result
+        
+        def cache_clear(self):
+            """Drop the cached result for an instance"""
+            with lock:
+                self.__dict__.pop(cache_attr, None)
+        
+        wrapper.cache_clear = cache_clear
+        return wrapper
+    
+    return decorator